@@ -1,42 +1,76 @@
 import os
 import json
 import boto3
+import codecs
 import csv
-from io import StringIO
+import numpy as np
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO, TextIOWrapper
+from itertools import islice
+
+# Number of CSV files processed concurrently
+MAX_WORKERS = 16
+
+# Size of each ranged GET used to read the start of a CSV object
+HEAD_RANGE_BYTES = 64 * 1024
+
+def read_head_rows(s3_client, bucket_name, object_key, row_count):
+    # Fetch the object in ranged GETs until the first row_count rows are complete,
+    # so large files are never downloaded in full
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    text = ''
+    start = 0
+    # Later ranges must come from the same object version; an overwrite mid-read fails
+    # with PreconditionFailed instead of stitching rows from two different files
+    version_args = {}
+    while True:
+        byte_range = f'bytes={start}-{start + HEAD_RANGE_BYTES - 1}'
+        response = s3_client.get_object(Bucket=bucket_name, Key=object_key, Range=byte_range, **version_args)
+        version_args = {'IfMatch': response['ETag']}
+        chunk = response['Body'].read()
+        start += len(chunk)
+        at_end = start >= int(response['ContentRange'].rsplit('/', 1)[1])
+        text += decoder.decode(chunk, final=at_end)
+        
+        # The last parsed row may be cut off unless the whole object has been read
+        rows = list(islice(csv.reader(StringIO(text)), row_count + 1))
+        if at_end or len(rows) > row_count:
+            return rows[:row_count]
 
 def process_csv_file(s3_client, bucket_name, object_key, output_bucket):
-    # Read CSV from S3
-    csv_obj = s3_client.get_object(Bucket=bucket_name, Key=object_key)
-    csv_content = csv_obj['Body'].read().decode('utf-8')
-    csv_reader = csv.reader(StringIO(csv_content))
-    
-    # Convert CSV to list
-    csv_data = list(csv_reader)
+    # Read CSV head from S3; only the header and the two seed rows are needed
+    head_rows = read_head_rows(s3_client, bucket_name, object_key, 3)
     
     # Extract column names
-    column_names = csv_data[0]
+    column_names = head_rows[0]
     
     # Initialize data with the first two rows
-    data = csv_data[1:3]
+    seed_rows = head_rows[1:3]
+    # Cells beyond the header are ignored; short or missing seed rows are an error
+    seeds = np.array([row[:len(column_names)] for row in seed_rows], dtype=np.float64)
+    if seeds.shape != (2, len(column_names)):
+        raise ValueError(f"{object_key} needs two seed rows with {len(column_names)} values each")
+    data = np.empty((100, len(column_names)), dtype=np.float64)
+    data[:2] = seeds
     
-    # Generate additional rows
+    # Generate additional rows, each one the sum of the last two rows
     for i in range(2, 100):
-        new_row = []
-        for j in range(len(column_names)):
-            # Calculate new value as the sum of the last two rows
-            new_value = float(data[i-1][j]) + float(data[i-2][j])
-            new_row.append(new_value)
-        data.append(new_row)
-    
-    # Convert data back to CSV format
-    output = StringIO()
-    csv_writer = csv.writer(output)
+        np.add(data[i-1], data[i-2], out=data[i])
+    
+    # Convert data back to CSV format, encoding straight into the upload buffer
+    output = BytesIO()
+    output_text = TextIOWrapper(output, encoding='utf-8', newline='')
+    csv_writer = csv.writer(output_text)
     csv_writer.writerow(column_names)
-    csv_writer.writerows(data)
+    csv_writer.writerows(seed_rows)
+    csv_writer.writerows(data[2:].tolist())
+    output_text.flush()
+    output.seek(0)
     
     # Write the result back to S3
     output_key = f'output/processed_{os.path.basename(object_key)}'
-    s3_client.put_object(Bucket=output_bucket, Key=output_key, Body=output.getvalue())
+    s3_client.put_object(Bucket=output_bucket, Key=output_key, Body=output)
     print(f"Processed file {object_key} and saved to {output_key}")
 
 def main():
@@ -44,17 +78,22 @@ def main():
     input_bucket = os.environ['ENV_INPUT_BUCKET']
     output_bucket = os.environ['ENV_OUTPUT_BUCKET']
     
-    # S3 client
-    s3_client = boto3.client('s3')
+    # S3 client, shared by all worker threads
+    s3_client = boto3.client('s3', config=Config(max_pool_connections=MAX_WORKERS))
     
-    # List all objects in the input bucket
-    response = s3_client.list_objects_v2(Bucket=input_bucket)
+    # List every CSV key in the input bucket, page by page (1000 keys per page)
+    paginator = s3_client.get_paginator('list_objects_v2')
+    csv_keys = paginator.paginate(Bucket=input_bucket).search("Contents[?ends_with(Key, '.csv')].Key")
     
-    # Process each CSV file in the bucket
-    for obj in response.get('Contents', []):
-        object_key = obj['Key']
-        if object_key.endswith('.csv'):
-            process_csv_file(s3_client, input_bucket, object_key, output_bucket)
+    # Process the CSV files in the bucket concurrently
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [
+            executor.submit(process_csv_file, s3_client, input_bucket, object_key, output_bucket)
+            for object_key in csv_keys
+            if object_key  # search() yields None for an empty page
+        ]
+        for future in futures:
+            future.result()
 
 if __name__ == "__main__":
     main()
@@ -1,99 +1,222 @@
 import os
 import json
 import boto3
+from botocore.config import Config
 import psycopg2
+from psycopg2 import sql
 import csv
+import io
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Environment variables are fixed for the lifetime of the execution environment
+CONFIG = {
+    name: os.environ.get(name)
+    for name in ('RDS_SECRET_ARN', 'RDS_ENDPOINT', 'DATABASE_NAME', 'TABLE_NAME', 'STATE_MACHINE_ARN')
+}
+
+# AWS clients live at module scope so warm invocations reuse them.
+# One session shares resolved credentials and loaded service models across all clients.
+session = boto3.Session(region_name=os.environ.get('AWS_REGION'))
+boto_config = Config(
+    tcp_keepalive=True,
+    connect_timeout=2,
+    read_timeout=10,
+    retries={'max_attempts': 3, 'mode': 'adaptive'}
+)
+s3_client = session.client('s3', config=boto_config)
+sf_client = session.client('stepfunctions', config=boto_config)
+secrets_client = session.client('secretsmanager', config=boto_config)
+
+# Files in one event load concurrently. psycopg2 connections must not be shared between
+# threads, so each long-lived worker thread caches its own connection.
+MAX_WORKERS = 4
+file_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+_local = threading.local()
+_ddl_lock = threading.Lock()
+
+# Decoded secrets are reused for this many seconds before Secrets Manager is called again
+SECRET_CACHE_TTL = 600
+_secret_cache = {}
+
+class CsvCopyStream:
+    """File-like object feeding COPY FROM STDIN with the valid CSV rows, each prefixed with the load file."""
+
+    def __init__(self, reader, load_file, width):
+        self._rows = (row for row in reader if len(row) == width)
+        self._load_file = load_file
+        # Quote every field so empty cells load as '' rather than NULL
+        self._writer = csv.writer(self, quoting=csv.QUOTE_ALL, lineterminator='\n')
+        self._chunks = []
+        self._size = 0
+        self.rows_count = 0
+
+    def write(self, text):
+        self._chunks.append(text)
+        self._size += len(text)
+
+    def read(self, size=-1):
+        for row in self._rows:
+            self._writer.writerow([self._load_file] + row)
+            self.rows_count += 1
+            if 0 <= size <= self._size:
+                break
+        data = "".join(self._chunks)
+        if 0 <= size < len(data):
+            data, rest = data[:size], data[size:]
+            self._chunks, self._size = [rest], len(rest)
+        else:
+            self._chunks, self._size = [], 0
+        return data
+
 def get_creds(secret_arn):
-    """Retrieves DB credentials from Secrets Manager."""
-    client = boto3.client('secretsmanager')
+    """Retrieves DB credentials from Secrets Manager, cached across warm invocations."""
+    cached = _secret_cache.get(secret_arn)
+    if cached and time.monotonic() - cached[1] < SECRET_CACHE_TTL:
+        return cached[0]
     try:
-        response = client.get_secret_value(SecretId=secret_arn)
-        return json.loads(response['SecretString'])
+        response = secrets_client.get_secret_value(SecretId=secret_arn)
+        creds = json.loads(response['SecretString'])
     except Exception as e:
-        logger.error(f"Failed to retrieve secret: {str(e)}")
+        logger.error("Failed to retrieve secret: %s", e)
         raise
+    _secret_cache[secret_arn] = (creds, time.monotonic())
+    return creds
 
-def lambda_handler(event, context):
-    connection = None
+def get_connection(host, db_name, creds):
+    """Returns this thread's cached RDS connection, reconnecting if it is closed or stale."""
+    connection = getattr(_local, 'connection', None)
+    if connection is not None and not connection.closed:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return connection
+        except psycopg2.Error as e:
+            logger.warning("Cached RDS connection is stale, reconnecting: %s", e)
+            connection.close()
+
+    # Connect to RDS PostgreSQL
+    connection = psycopg2.connect(
+        host=host,
+        user=creds['username'],
+        password=creds['password'],
+        dbname=db_name,
+        port=creds.get('port', 5432),
+        sslmode='require',
+        connect_timeout=5,
+        application_name='lambda-csv-loader',
+        # TCP keepalives stop NAT/firewalls silently dropping the idle connection between invocations
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=5,
+        # Bound how long unacknowledged writes (e.g. the SELECT 1 probe) wait on a dropped socket
+        tcp_user_timeout=30000
+    )
+    connection.autocommit = True # Standard for simple inserts
+    _local.connection = connection
+    logger.info("RDS Connection opened.")
+    return connection
+
+def connect(host, db_name, secret_arn):
+    """Returns a live connection, refreshing the cached secret once if it was rotated."""
     try:
-        # Load Environment Variables
-        secret_arn = os.environ['RDS_SECRET_ARN']
-        host = os.environ['RDS_ENDPOINT']
-        db_name = os.environ['DATABASE_NAME']
-        table_name = os.environ['TABLE_NAME']
-        sm_arn = os.environ['STATE_MACHINE_ARN']
-        
-        creds = get_creds(secret_arn)
+        return get_connection(host, db_name, get_creds(secret_arn))
+    except psycopg2.OperationalError:
+        # The cached secret may have been rotated; refresh it once and retry
+        logger.warning("RDS connection failed, refreshing credentials and retrying.")
+        _secret_cache.pop(secret_arn, None)
+        return get_connection(host, db_name, get_creds(secret_arn))
+
+def load_csv_file(bucket, key, table_name, host, db_name, secret_arn):
+    """Streams one CSV object from S3 into the RDS table and returns the number of rows loaded."""
+    connection = connect(host, db_name, secret_arn)
+    
+    logger.info("Processing file: s3://%s/%s", bucket, key)
+    
+    # Stream CSV rows straight from the S3 response body
+    obj = s3_client.get_object(Bucket=bucket, Key=key)
+    reader = csv.reader(io.TextIOWrapper(obj['Body'], encoding='utf-8', newline=''))
+    header = next(reader)
+    columns = [h.strip() for h in header]
+
+    with connection.cursor() as cursor:
+        # 1. Dynamically create table if it doesn't exist
+        # id, file_metadata columns + CSV columns; Identifier escapes quotes in header names
+        col_defs = sql.SQL(", ").join([sql.SQL("{} TEXT").format(sql.Identifier(c)) for c in columns])
+        create_sql = sql.SQL("CREATE TABLE IF NOT EXISTS {} (id SERIAL PRIMARY KEY, load_file TEXT, {})").format(
+            sql.Identifier(table_name), col_defs
+        )
+        # Concurrent CREATE TABLE IF NOT EXISTS can still collide in the catalog
+        with _ddl_lock:
+            cursor.execute(create_sql)
         
-        # Connect to RDS PostgreSQL
-        connection = psycopg2.connect(
-            host=host,
-            user=creds['username'],
-            password=creds['password'],
-            dbname=db_name,
-            port=creds.get('port', 5432),
-            connect_timeout=10
+        # 2. Bulk Load via COPY (no per-row statement parsing)
+        col_names = sql.SQL(", ").join([sql.Identifier(c) for c in columns])
+        copy_sql = sql.SQL("COPY {} (load_file, {}) FROM STDIN WITH (FORMAT csv)").format(
+            sql.Identifier(table_name), col_names
         )
-        connection.autocommit = True # Standard for simple inserts
+        
+        stream = CsvCopyStream(reader, key, len(header))
+        cursor.copy_expert(copy_sql, stream)
+    
+    logger.info("Successfully loaded %d rows.", stream.rows_count)
+    return stream.rows_count
 
-        s3 = boto3.client('s3')
-        sf_client = boto3.client('stepfunctions')
+def lambda_handler(event, context):
+    try:
+        # Lazy %-formatting: the event is only rendered when DEBUG logging is enabled
+        logger.debug("Received event: %s", event)
+
+        # Load Environment Variables
+        missing = [name for name, value in CONFIG.items() if value is None]
+        if missing:
+            raise KeyError(f"Missing environment variables: {', '.join(missing)}")
+        secret_arn = CONFIG['RDS_SECRET_ARN']
+        host = CONFIG['RDS_ENDPOINT']
+        db_name = CONFIG['DATABASE_NAME']
+        table_name = CONFIG['TABLE_NAME']
+        sm_arn = CONFIG['STATE_MACHINE_ARN']
 
+        # Load every file in the event concurrently
+        keys = []
+        futures = []
         for record in event['Records']:
             bucket = record['s3']['bucket']['name']
             key = record['s3']['object']['key']
-            
-            logger.info(f"Processing file: s3://{bucket}/{key}")
-            
-            # Read CSV
-            obj = s3.get_object(Bucket=bucket, Key=key)
-            lines = obj['Body'].read().decode('utf-8').splitlines()
-            reader = csv.reader(lines)
-            header = next(reader)
+            keys.append(key)
+            futures.append(file_executor.submit(
+                load_csv_file, bucket, key, table_name, host, db_name, secret_arn
+            ))
+        # Let every load finish before raising, so no worker is frozen mid-COPY
+        wait(futures)
+        for future in futures:
+            if future.exception() is not None:
+                raise future.exception()
+        files_processed = [
+            {"file_processed": key, "rows_count": future.result()}
+            for key, future in zip(keys, futures)
+        ]
 
-            with connection.cursor() as cursor:
-                # 1. Dynamically create table if it doesn't exist
-                # id, file_metadata columns + CSV columns
-                col_defs = ", ".join([f'"{h.strip()}" TEXT' for h in header])
-                create_sql = f'CREATE TABLE IF NOT EXISTS "{table_name}" (id SERIAL PRIMARY KEY, load_file TEXT, {col_defs})'
-                cursor.execute(create_sql)
-                
-                # 2. Bulk Insert
-                col_names = ", ".join([f'"{h.strip()}"' for h in header])
-                placeholders = ", ".join(['%s'] * (len(header) + 1))
-                insert_sql = f'INSERT INTO "{table_name}" (load_file, {col_names}) VALUES ({placeholders})'
-                
-                rows_processed = 0
-                for row in reader:
-                    if len(row) == len(header):
-                        cursor.execute(insert_sql, [key] + row)
-                        rows_processed += 1
-                
-                logger.info(f"Successfully loaded {rows_processed} rows.")
-
-                # 3. Trigger Step Function
-                if sm_arn:
-                    sf_client.start_execution(
-                        stateMachineArn=sm_arn,
-                        input=json.dumps({
-                            "status": "COMPLETED",
-                            "file_processed": key,
-                            "rows_count": rows_processed
-                        })
-                    )
+        # 3. Trigger Step Function once for every file in the event
+        if sm_arn and files_processed:
+            sf_client.start_execution(
+                stateMachineArn=sm_arn,
+                input=json.dumps({
+                    "status": "COMPLETED",
+                    "files_processed": files_processed,
+                    "rows_count": sum(f["rows_count"] for f in files_processed)
+                })
+            )
 
         return {"statusCode": 200, "body": "Processing Complete"}
 
     except Exception as e:
-        logger.error(f"Critical Error: {str(e)}")
+        logger.error("Critical Error: %s", e)
         raise e
-    finally:
-        if connection:
-            connection.close()
-            logger.info("RDS Connection closed.")
\ No newline at end of file
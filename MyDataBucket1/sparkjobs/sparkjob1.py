@@ -1,29 +1,70 @@
+from pyspark import TaskContext
 from pyspark.sql import SparkSession
+from pyspark.sql.functions import col
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import sys
+# Number of rows per request
+BATCH_SIZE = 500
+# Connect and read timeouts (seconds) for each request
+REQUEST_TIMEOUT = (3.05, 10)
+def create_session():
+    # Keep-alive session reused for every batch of a partition, retrying transient failures.
+    # read=0 never resends a POST once it reached the endpoint, and an exhausted retry returns
+    # the last response, so send_batch reports failures instead of the task failing and Spark
+    # replaying batches already accepted (allowed_methods: urllib3>=1.26)
+    session = requests.Session()
+    retries = Retry(
+        total=3,
+        read=0,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(['POST']),
+        raise_on_status=False
+    )
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retries))
+    return session
+def post_batches(rows, endpoint_url, batch_size=BATCH_SIZE):
+    # Runs on each executor: stream the partition's rows to the endpoint in batches
+    partition_id = TaskContext.get().partitionId()
+    with create_session() as session:
+        batch = []
+        start = 0
+        for row in rows:
+            batch.append(row.asDict())
+            if len(batch) >= batch_size:
+                send_batch(session, endpoint_url, batch, partition_id, start)
+                start += len(batch)
+                batch = []
+        if batch:
+            send_batch(session, endpoint_url, batch, partition_id, start)
+def send_batch(session, endpoint_url, data, partition_id, start):
+    try:
+        response = session.post(endpoint_url, json=data, verify=True, timeout=REQUEST_TIMEOUT)  # SSL verification
+    except requests.RequestException as e:
+        print(f"Failed to send batch starting at index {start} of partition {partition_id}, Error: {e}")
+        return
+    if response.status_code == 200:
+        print(f"Successfully sent batch starting at index {start} of partition {partition_id}")
+    else:
+        print(f"Failed to send batch starting at index {start} of partition {partition_id}, Status Code: {response.status_code}")
 def main(s3_path, endpoint_url, partition_number):
     # Initialize Spark session
     spark = SparkSession.builder \
         .appName("PartitionAndSendData") \
         .getOrCreate()
-    # Read data from S3
-    df = spark.read.csv(s3_path, header=True, inferSchema=True)
+    # Read data from S3 in a single pass; without inferSchema every column is read as a
+    # string, so only the column that is compared numerically is cast
+    df = spark.read.csv(s3_path, header=True)
+    value = col('value').cast('double')
+    # Process the data (example: filter and select specific columns) before the shuffle
+    # so only surviving rows and columns are repartitioned
+    filtered_df = df.filter(value > 100).select('category', value.alias('value'))
     # Partition the data
-    partitioned_df = df.repartition(partition_number)
-    # Process the data (example: filter and select specific columns)
-    processed_df = partitioned_df.filter(df['value'] > 100).select('category', 'value')
-    # Convert DataFrame to Pandas for sending via HTTP
-    pandas_df = processed_df.toPandas()
-    # Send data to the endpoint in batches
-    batch_size = 10  # Number of rows per request
-    for start in range(0, len(pandas_df), batch_size):
-        batch = pandas_df.iloc[start:start + batch_size]
-        data = batch.to_dict(orient='records')
-        response = requests.post(endpoint_url, json=data, verify=True)  # SSL verification
-        if response.status_code == 200:
-            print(f"Successfully sent batch starting at index {start}")
-        else:
-            print(f"Failed to send batch starting at index {start}, Status Code: {response.status_code}")
+    processed_df = filtered_df.repartition(partition_number)
+    # Send data to the endpoint in batches, in parallel from every partition
+    processed_df.foreachPartition(lambda rows: post_batches(rows, endpoint_url))
     # Stop the Spark session
     spark.stop()
 if __name__ == "__main__":